@@ -0,0 +1,214 @@
+"""Shared pytest setup for the Warbler tests.
+
+To run the tests, you must provide a "test database", since these tests
+delete & recreate the tables & data. In your shell:
+
+Do this only once:
+  $ createdb warbler_test
+
+To run the tests using that test database, spread across all CPU cores:
+  $ DATABASE_URL=postgresql:///warbler_test python3 -m pytest -n auto
+
+On a Postgres cluster used only for tests, setting `fsync = off` and
+`full_page_writes = off` in its postgresql.conf speeds things up further.
+"""
+
+import os
+from unittest import TestCase
+
+import pytest
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, make_url, text
+from sqlalchemy.orm import Session
+
+# app.py loads .env too, but DATABASE_URL is needed here before its import
+load_dotenv()
+
+BASE_DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+if not BASE_DATABASE_URL.endswith("_test"):
+    raise Exception(
+        "\n\nMust set DATABASE_URL env var to db ending with _test")
+
+# Under pytest-xdist every worker gets its own database (warbler_gw0_test,
+# warbler_gw1_test, ...) so they can run side by side. This has to happen
+# before the app is imported, since that's when its engine gets created.
+WORKER_ID = os.environ.get("PYTEST_XDIST_WORKER")
+
+if WORKER_ID:
+    base_url = make_url(BASE_DATABASE_URL)
+    worker_db_name = f"{base_url.database.removesuffix('_test')}_{WORKER_ID}_test"
+    os.environ['DATABASE_URL'] = (
+        base_url
+        .set(database=worker_db_name)
+        .render_as_string(hide_password=False)
+    )
+
+# Flask reads this when the app is created, so it must be set beforehand
+os.environ['FLASK_DEBUG'] = '0'
+
+from app import app  # noqa: E402
+from models import db, bcrypt, User  # noqa: E402
+
+# Skip the debug toolbar and template reloading on every test request
+app.config['DEBUG_TB_ENABLED'] = False
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.config['EXPLAIN_TEMPLATE_LOADING'] = False
+app.jinja_env.auto_reload = False
+
+# The fixture users' password, hashed once at bcrypt's minimum cost (the
+# real cost is still covered by User.signup's own tests)
+PASSWORD_HASH = bcrypt.generate_password_hash(
+    "password", rounds=4).decode('UTF-8')
+
+
+def disable_synchronous_commit(dbapi_connection, connection_record):
+    """Don't wait for the WAL to reach disk when committing.
+
+    Nothing in a test database needs to survive a crash.
+    """
+
+    # Run the SET outside of a transaction, so a rollback can't undo it
+    autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute("SET synchronous_commit = OFF")
+    cursor.close()
+
+    dbapi_connection.autocommit = autocommit
+
+
+with app.app_context():
+    event.listen(db.engine, "connect", disable_synchronous_commit)
+
+
+def pytest_configure(config):
+    """Build the tables once per run, in the base test database.
+
+    Under xdist, this runs in the controlling process before any workers
+    start; each worker then clones the base database as a template, which
+    is much quicker than every worker re-running the DDL itself.
+    """
+
+    if WORKER_ID:
+        return
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        # Postgres won't copy a template database that has open connections
+        db.engine.dispose()
+
+
+def create_admin_engine():
+    """Make an engine on the maintenance db, to create & drop databases."""
+
+    return create_engine(
+        make_url(BASE_DATABASE_URL).set(database="postgres"),
+        isolation_level="AUTOCOMMIT",
+    )
+
+
+def create_worker_database(admin_engine, db_name):
+    """(Re)create an xdist worker's database from the base test db."""
+
+    template_db_name = make_url(BASE_DATABASE_URL).database
+
+    with admin_engine.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{db_name}"'))
+        conn.execute(text(
+            f'CREATE DATABASE "{db_name}" TEMPLATE "{template_db_name}"'))
+
+
+def drop_worker_database(admin_engine, db_name):
+    """Drop an xdist worker's database, once its tests are done."""
+
+    with admin_engine.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{db_name}"'))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """Set up the database for this test session (per worker, under xdist).
+
+    The session is pinned to a single connection, inside a transaction that
+    is rolled back at the end, so nothing the tests do is ever committed.
+    The app's own commit()/rollback() calls only release or roll back
+    SAVEPOINTs within it.
+    """
+
+    if WORKER_ID:
+        admin_engine = create_admin_engine()
+        create_worker_database(admin_engine, worker_db_name)
+
+    with app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        db.session.registry.set(Session(
+            bind=connection,
+            join_transaction_mode="create_savepoint",
+        ))
+
+        yield connection
+
+        db.session.remove()
+        transaction.rollback()
+        connection.close()
+        db.engine.dispose()
+
+    if WORKER_ID:
+        drop_worker_database(admin_engine, worker_db_name)
+        admin_engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def db_rollback(database):
+    """Run each test in a SAVEPOINT, which is rolled back afterwards."""
+
+    savepoint = database.begin_nested()
+
+    yield
+
+    db.session.close()
+    savepoint.rollback()
+
+
+def seed_users(connection):
+    """Insert the fixture users u1 & u2; return their ids, (u1_id, u2_id).
+
+    The rows go straight onto the connection, so they never need flushing
+    or committing by the session.
+    """
+
+    q_users = db.insert(User).returning(
+        User.id, sort_by_parameter_order=True)
+    u1_id, u2_id = connection.execute(q_users, [
+        dict(username="u1", email="u1@email.com", password=PASSWORD_HASH),
+        dict(username="u2", email="u2@email.com", password=PASSWORD_HASH),
+    ]).scalars().all()
+
+    return u1_id, u2_id
+
+
+class SeededTestCase(TestCase):
+    """Test case whose fixture data is created once per class.
+
+    setUpClass opens a SAVEPOINT on the session's pinned connection (see
+    the database fixture) and seeds u1 & u2 in it; subclasses extend
+    setUpClass to add their own rows. tearDownClass rolls it all back, and
+    db_rollback runs each test in a nested SAVEPOINT of its own.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.connection = db.session.get_bind()
+        cls.fixtures = cls.connection.begin_nested()
+
+        cls.u1_id, cls.u2_id = seed_users(cls.connection)
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.close()
+        cls.fixtures.rollback()
@@ -1,54 +1,25 @@
 """User model tests."""
 
 import os
-from unittest import TestCase
 
-from app import app
 from models import db, dbx, User, Message
 from sqlalchemy import exc
+from conftest import SeededTestCase
 
-# To run the tests, you must provide a "test database", since these tests
-# delete & recreate the tables & data. In your shell:
-#
-# Do this only once:
-#   $ createdb warbler_test
-#
-# To run the tests using that test data:
-# $ DATABASE_URL=postgresql:///warbler_test python3 -m unittest
+# The test database setup, and how to run the tests, is in conftest.py
 
-if not app.config['SQLALCHEMY_DATABASE_URI'].endswith("_test"):
-    raise Exception(
-        "\n\nMust set DATABASE_URL env var to db ending with _test")
 
-# NOW WE KNOW WE'RE IN THE RIGHT DATABASE, SO WE CAN CONTINUE
-app.app_context().push()
-db.drop_all()
-db.create_all()
+class UserModelTestCase(SeededTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
 
-
-class UserModelTestCase(TestCase):
-    def setUp(self):
-        dbx(db.delete(User))
-        db.session.commit()
-
-        u1 = User.signup("u1", "u1@email.com", "password", None)
-        db.session.flush()
-
-        u2 = User.signup("u2", "u2@email.com", "password", None)
-        db.session.flush()
-
-        m1 = Message(text="m1-text", user_id=u2.id)
-
-        db.session.add_all([m1])
-        db.session.commit()
-
-        self.u1_id = u1.id
-        self.m1_id = m1.id
-
-        self.u2_id = u2.id
-
-    def tearDown(self):
-        db.session.rollback()
+        q_message = (db
+                     .insert(Message)
+                     .values(text="m1-text", user_id=cls.u2_id)
+                     .returning(Message.id)
+                     )
+        cls.m1_id = cls.connection.execute(q_message).scalar_one()
 
     def test_user_model(self):
         u1 = db.session.get(User, self.u1_id)